@@ -20,12 +20,57 @@
 #
 
 import datetime                         # Date and time manipulator
+import functools                        # For caching parsed timestamps
+import itertools                        # For a thread-safe message counter
 import logging                          # Logging facilities
 import xml.etree.ElementTree as Xml     # XML parser
+from xml.sax.saxutils import escape     # For escaping text inserted into the acknowledgement template
 import utils
 
+try:
+    from lxml import etree as lxml_etree    # libxml2 based XML parser (optional, faster than ElementTree)
+except ImportError:
+    lxml_etree = None
+
 logger = logging.getLogger('server.cap')
-msg_counter = 0
+
+# Acknowledgement message counter, shared between request handler threads
+msg_counter = itertools.count()
+
+# CAP v1.2 namespace
+# NOTE: CAP v1.2 is hardcoded right now
+_NS_CAP = 'urn:oasis:names:tc:emergency:cap:1.2'
+
+# Fully qualified (Clark notation) names of the CAP elements that are looked up.
+# ElementTree can match these directly, without having to resolve a namespace prefix on every lookup.
+_TAG = {e: f'{{{_NS_CAP}}}{e}' for e in ('alert', 'identifier', 'sender', 'sent', 'status', 'msgType', 'scope',
+                                         'references', 'info', 'category', 'event', 'urgency', 'severity',
+                                         'certainty', 'language', 'effective', 'expires', 'description')}
+
+def _build_response_template() -> str:
+    """
+    Serialize the acknowledgement message once, with str.format() placeholders for the fields that differ between
+    acknowledgements. Only the placeholders have to be filled in for every message received.
+    """
+
+    root = Xml.Element('alert')
+    root.attrib = { 'xmlns': _NS_CAP }
+
+    for tag, text in (('identifier',    '{identifier}'),
+                      ('sender',        '{sender}'),
+                      ('sent',          '{sent}'),
+                      ('status',        'Actual'),
+                      ('msgType',       'Ack'),
+                      ('scope',         'Public'),
+                      ('references',    '{references}')):
+        Xml.SubElement(root, tag).text = text
+
+    return Xml.tostring(root, encoding='unicode', xml_declaration=True)
+
+_RESPONSE_TEMPLATE = _build_response_template()
+
+# Exceptions raised by the XML parser backend(s) on malformed input
+_PARSE_ERRORS = (Xml.ParseError,) if lxml_etree is None else (Xml.ParseError, lxml_etree.XMLSyntaxError)
 
 class CAPParser():
     """ CAP message parser, this parser only parses looks at the subset of the CAP v1.2 standard supported by Dutch brokers """
@@ -38,7 +83,7 @@ class CAPParser():
     # CAP version namespaces
     # NOTE: CAP v1.2 is hardcoded right now
     NS = {
-            'CAPv1.2': 'urn:oasis:names:tc:emergency:cap:1.2'
+            'CAPv1.2': _NS_CAP
     }
 
     # timestamp format specified in the CAP v1.2 standard
@@ -58,13 +103,8 @@ class CAPParser():
     def generate_timestamp(self):
         """ Generate a current timestamp """
 
-        timezone = datetime.datetime.now(datetime.timezone.utc).astimezone().tzinfo
-
-        # convert current time to string
-        timestamp = datetime.datetime.now(tz=timezone).strftime(self.TIMESTAMP_FORMAT)
-
-        # add a colon separator to the UTC offset (as required by the CAP v1.2 standard)
-        return '{0}:{1}'.format(timestamp[:-2], timestamp[-2:])
+        # isoformat() already separates the UTC offset with a colon (as required by the CAP v1.2 standard)
+        return datetime.datetime.now().astimezone().isoformat(timespec='seconds')
 
     def generate_response(self, ref_identifier, ref_sender, ref_sent):
         """
@@ -72,43 +112,22 @@ class CAPParser():
         This applies to all types of requests as they all expect the same format of acknowledgement.
         """
 
-        global msg_counter
-
-        root = Xml.Element('alert')
-        root.attrib = { 'xmlns': self.NS['CAPv1.2'] }
-
         # TODO include msg type too?
-        identifier = Xml.SubElement(root, 'identifier')
-        identifier.text = f'{self.src_identifier}.{msg_counter}'
-        msg_counter += 1
-
-        sender = Xml.SubElement(root, 'sender')
-        sender.text = self.src_sender
-
-        sent = Xml.SubElement(root, 'sent')
-        sent.text = self.generate_timestamp()
-
-        status = Xml.SubElement(root, 'status')
-        status.text = 'Actual'
-
-        msgType = Xml.SubElement(root, 'msgType')
-        msgType.text = 'Ack'
+        identifier = f'{self.src_identifier}.{next(msg_counter)}'
 
-        scope = Xml.SubElement(root, 'scope')
-        scope.text = 'Public'
-
-        references = Xml.SubElement(root, 'references')
-        references.text = f'{ref_sender},{ref_identifier},{ref_sent}'
-
-        return Xml.tostring(root, encoding='unicode', xml_declaration=True)
+        return _RESPONSE_TEMPLATE.format(identifier=escape(identifier),
+                                         sender=escape(self.src_sender),
+                                         sent=self.generate_timestamp(),
+                                         references=escape(f'{ref_sender},{ref_identifier},{ref_sent}'))
 
     @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def get_datetime(timestamp):
-        """ Check if the timestamp that has been received is valid """
+        """ Check if the timestamp that has been received is valid (results are cached, datetimes are immutable) """
 
         try:
             return datetime.datetime.strptime(timestamp, CAPParser.TIMESTAMP_FORMAT)
-        except ValueError:
+        except (ValueError, TypeError):
             return None
 
     def __check_info_elements(self, info):
@@ -117,44 +136,44 @@ class CAPParser():
         # List of _required_ elements in the <info> container
         info_elements = ('category', 'event', 'urgency', 'severity', 'certainty')
 
+        # Collect the text of the <info> children in a single pass, keeping the first occurrence like find() does
+        children = {}
+        for child in info:
+            children.setdefault(child.tag, child.text)
+
         # check for the presence of required elements
         for e in info_elements:
-            if info.find(f'CAPv1.2:{e}', self.NS) is None:
-                logger.error(f'required element missing from <info> container: {e}')
+            if _TAG[e] not in children:
+                logger.error('required element missing from <info> container: %s', e)
                 return False
 
         # check <language>, as it should basically always be present
-        if info.find(f'CAPv1.2:language', self.NS) is None:
+        if _TAG['language'] not in children:
             # Allow when not running in strict mode
-            if utils.logger_strict(logger, self._strict, '{required element missing from <info> container: language'):
+            if utils.logger_strict(logger, self._strict, 'required element missing from <info> container: language'):
                 return False
 
         # check <category>, it should always have a value of 'Safety'
         # though this may be different in practise, so we just throw a warning
-        category = info.find(f'CAPv1.2:category', self.NS).text
+        category = children[_TAG['category']]
         if category != 'Safety':
-            logger.warning(f'invalid category: {category}')
+            logger.warning('invalid category: %s', category)
 
         # these fields should always return 'Unknown' from an NL broker
         # though this may be different in practise, so we just throw a warning
-        urgency = info.find(f'CAPv1.2:urgency', self.NS).text
-        if urgency != 'Unknown':
-            logger.warning(f'invalid urgency: {urgency}')
-        severity = info.find(f'CAPv1.2:severity', self.NS).text
-        if severity != 'Unknown':
-            logger.warning(f'invalid severity: {severity}')
-        certainty = info.find(f'CAPv1.2:certainty', self.NS).text
-        if certainty != 'Unknown':
-            logger.warning(f'invalid certainty: {certainty}')
-
-        # check if the <effective> and <expires> timestamps are formatted correctly
-        effective = info.find('CAPv1.2:effective', self.NS).text
+        for e in ('urgency', 'severity', 'certainty'):
+            value = children[_TAG[e]]
+            if value != 'Unknown':
+                logger.warning('invalid %s: %s', e, value)
+
+        # check if the <effective> and <expires> timestamps are present and formatted correctly
+        effective = children.get(_TAG['effective'])
         if CAPParser.get_datetime(effective) is None:
-            logger.error(f'invalid <effective> timestamp format: {effective}')
+            logger.error('invalid <effective> timestamp format: %s', effective)
             return False
-        expires = info.find('CAPv1.2:expires', self.NS).text
+        expires = children.get(_TAG['expires'])
         if CAPParser.get_datetime(expires) is None:
-            logger.error(f'invalid <expires> timestamp format: {expires}')
+            logger.error('invalid <expires> timestamp format: %s', expires)
             return False
 
         return True
@@ -165,20 +184,22 @@ class CAPParser():
         # List of _required_ elements in the <alert> container
         alert_elements = ('identifier', 'sender', 'sent', 'status', 'msgType', 'scope')
 
-        # check for the presence of required elements
+        # check for the presence of required elements, keeping them around so they only have to be looked up once
+        elements = {}
         for e in alert_elements:
-            if alert.find(f'CAPv1.2:{e}', self.NS) is None:
-                logger.error(f'required element missing from <alert> container: {e}')
+            elements[e] = alert.find(_TAG[e])
+            if elements[e] is None:
+                logger.error('required element missing from <alert> container: %s', e)
                 return False
 
         # check if the timestamp is formatted correctly
-        timestamp = alert.find('CAPv1.2:sent', self.NS).text
+        timestamp = elements['sent'].text
         if CAPParser.get_datetime(timestamp) is None:
-            logger.error(f'invalid <sent> timestamp format: {timestamp}')
+            logger.error('invalid <sent> timestamp format: %s', timestamp)
             return False
 
-        msgType = alert.find('CAPv1.2:msgType', self.NS).text
-        status = alert.find('CAPv1.2:status', self.NS).text
+        msgType = elements['msgType'].text
+        status = elements['status'].text
 
         if msgType == 'Alert':
             # check if <info> is present when <msgType> has the value 'Alert'
@@ -186,7 +207,7 @@ class CAPParser():
             #
             # We will ignore this (even in strict mode) when <status> has the value 'Test'
             if status != 'Test':
-                info = alert.find(f'CAPv1.2:info', self.NS)
+                info = alert.find(_TAG['info'])
                 if info is None:
                     logger.error('required element missing from <alert> container: info')
                     return False
@@ -196,17 +217,17 @@ class CAPParser():
                     return False
         elif msgType == 'Cancel':
             # Check <msgType> separately because it influences whether the element <references> is required
-            if alert.find('CAPv1.2:references', self.NS) is None:
+            if alert.find(_TAG['references']) is None:
                 # <references> is required for Cancel
                 if logger.error('required element missing from <alert> container: references'):
                     return False
 
         # check <scope>, as it should always be 'Public'
-        scope = alert.find('CAPv1.2:scope', self.NS).text
+        scope = elements['scope'].text
         if scope != 'Public':
             # In production this should always be 'Public'. In a development/test environment this may
             # not always be this case.
-            if utils.logger_strict(logger, self._strict, f'invalid scope: {scope}'):
+            if utils.logger_strict(logger, self._strict, 'invalid scope: %s', scope):
                 return False
 
         return True
@@ -237,14 +258,19 @@ class CAPParser():
 
         # Parse the received XML
         try:
-            root = Xml.fromstring(raw)
-        except Xml.ParseError:
+            if lxml_etree is not None:
+                # Never resolve entities or fetch external resources, this protects against XML DDoS attacks
+                parser = lxml_etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=False)
+                root = lxml_etree.fromstring(raw, parser=parser)
+            else:
+                root = Xml.fromstring(raw)
+        except _PARSE_ERRORS:
             logger.error('invalid XML schema received')
             return False
 
         # Check the if the namespace matches what is expected of the main broker (CAP v1.2)
-        if root.tag != f'{{{self.NS["CAPv1.2"]}}}alert':
-            if utils.logger_strict(logger, self._strict, f'invalid namespace: {root.tag}'):
+        if root.tag != _TAG['alert']:
+            if utils.logger_strict(logger, self._strict, 'invalid namespace: %s', root.tag):
                 return False
 
         # Check if all required elements are present
@@ -252,29 +278,29 @@ class CAPParser():
             return False
 
         # Parse the elements into class-wide variables
-        msgType = root.find('CAPv1.2:msgType', self.NS).text
+        msgType = root.find(_TAG['msgType']).text
 
-        self.identifier = root.find(f'CAPv1.2:identifier', self.NS).text
-        self.sender = root.find(f'CAPv1.2:sender', self.NS).text
-        self.sent = root.find(f'CAPv1.2:sent', self.NS).text
+        self.identifier = root.find(_TAG['identifier']).text
+        self.sender = root.find(_TAG['sender']).text
+        self.sent = root.find(_TAG['sent']).text
 
         if msgType == 'Alert':
-            status = root.find('CAPv1.2:status', self.NS).text
+            status = root.find(_TAG['status']).text
             if status == 'Test':
                 self.msg_type = self.TYPE_LINK_TEST
             elif status == 'Actual':
                 self.msg_type = self.TYPE_ALERT
 
-                info = root.find(f'CAPv1.2:info', self.NS)
-                self.lang = info.find(f'CAPv1.2:language', self.NS).text
-                self.effective = CAPParser.get_datetime(info.find(f'CAPv1.2:effective', self.NS).text)
-                self.expires = CAPParser.get_datetime(info.find(f'CAPv1.2:expires', self.NS).text)
-                self.description = info.find(f'CAPv1.2:description', self.NS).text
+                info = root.find(_TAG['info'])
+                self.lang = info.find(_TAG['language']).text
+                self.effective = CAPParser.get_datetime(info.find(_TAG['effective']).text)
+                self.expires = CAPParser.get_datetime(info.find(_TAG['expires']).text)
+                self.description = info.find(_TAG['description']).text
         elif msgType == 'Cancel':
             self.msg_type = self.TYPE_CANCEL
 
-            self.references = self.__parse_references(root.find(f'CAPv1.2:references', self.NS).text)
+            self.references = self.__parse_references(root.find(_TAG['references']).text)
         if self.msg_type is None:
-            logger.error(f'Unknown message type: {msgType}')
+            logger.error('Unknown message type: %s', msgType)
 
         return True
@@ -22,12 +22,13 @@
 import flask                                # Flask HTTP server library
 import logging                              # Logging facilities
 import logging.handlers                     # Logging handlers
+import os                                   # For building file paths
 import pyexpat                              # CAP XML parser backend (only used for version check)
 import queue                                # Queue for passing data to the DAB processing thread
 import re                                   # For removing color from werkzeug's log messages
 import threading                            # Threading support (for running Flask in the background)
 from werkzeug.serving import make_server    # Flask backend
-from cap.parser import CAPParser            # CAP XML parser (internal)
+from cap.parser import CAPParser, lxml_etree    # CAP XML parser (internal)
 import utils
 
 logger = logging.getLogger('server.cap')
@@ -61,13 +62,16 @@ class StripEsc(logging.Filter):
 
 class CAPHTTP(threading.Thread):
     """ Actual Werkzeug/Flask server thread """
+
     def __init__(self, app, srvcfg):
         threading.Thread.__init__(self)
 
         host = srvcfg['cap']['host']
         port = int(srvcfg['cap']['port'])
 
-        self.server = make_server(host, port, app)
+        # Requests are handled in separate threads, so a slow client doesn't hold up other requests
+        self.server = make_server(host, port, app, threaded=True)
+
         self.ctx = app.app_context()
         self.ctx.push()
 
@@ -78,39 +82,59 @@ class CAPHTTP(threading.Thread):
         self.server.shutdown()
         super().join()
 
+        # Release the listening socket, so a restarted server can bind to the same address right away
+        self.server.server_close()
+
 class CAPServer():
+    # Accepted Content-Type MIME types for CAP messages
+    XML_MIMETYPES = ('application/xml', 'text/xml')
+
+    # Headers sent along with every acknowledgement
+    RESPONSE_HEADERS = {'Content-Type': 'application/xml; charset=utf-8'}
+
+    # Maximum accepted request body size (in bytes), CAP messages are well under this
+    MAX_CONTENT_LENGTH = 256 * 1024
+
+    def _too_large(self, e):
+        logger.error('Request body exceeds %d bytes, rejecting', self.MAX_CONTENT_LENGTH)
+        return flask.Response(status=413)
+
     def _index(self):
         # Obtain the Client's IP
         route = flask.request.access_route
         client_addr = next((addr for addr in reversed(route) if addr != '127.0.0.1'), flask.request.remote_addr)
 
         # Check if Content-Type header is set to an XML MIME type
-        content_type = flask.request.content_type
+        content_type = flask.request.content_type or ''
 
-        if not content_type.startswith('application/xml') and not content_type.startswith('text/xml'):
-            if utils.logger_strict(logger, self._strict, f'{"FAIL" if self._strict else "WARN"}: invalid Content-Type: {content_type}'):
+        if not content_type.startswith(self.XML_MIMETYPES):
+            if utils.logger_strict(logger, self._strict, 'invalid Content-Type: %s', content_type):
                 return flask.Response(status=415)
 
         # Initialize the CAP parser
         try:
             cp = CAPParser(self.app, self._strict, self._srvcfg['cap']['identifier'], self._srvcfg['cap']['sender'])
         except Exception as e:
-            logger.error(f'Unable to start the CAP parser: {e}')
+            logger.error('Unable to start the CAP parser: %s', e)
             return flask.Response(status=500)
 
+        # Read the request body once, it is both parsed and forwarded as-is to the DAB data streams.
+        # The body isn't cached on the request object, so only this single copy of it is kept around.
+        raw = flask.request.get_data(cache=False)
+
         # Parse the Xml into memory and check if all required elements present
-        if not cp.parse(flask.request.data):
+        if not cp.parse(raw):
             logger.error('Unable to parse message')
             return flask.Response(status=400)
 
         if cp.msg_type == CAPParser.TYPE_LINK_TEST:
-            logger.debug(f'{client_addr}: Link Test OK')
+            logger.debug('%s: Link Test OK', client_addr)
             pass
         elif cp.msg_type == CAPParser.TYPE_ALERT:
-            logger.debug(f'{client_addr}: Alert OK')
+            logger.debug('%s: Alert OK', client_addr)
             try:
                 self._q.put({
-                            'raw': flask.request.data,
+                            'raw': raw,
                             'msg_type': cp.msg_type,
                             'identifier': cp.identifier,
                             'sender': cp.sender,
@@ -123,11 +147,11 @@ class CAPServer():
             except queue.Full:
                 logger.error('Queue is full, perhaps increase queuelimit?')
         elif cp.msg_type == CAPParser.TYPE_CANCEL:
-            logger.debug(f'{client_addr}: Alert Cancel OK')
+            logger.debug('%s: Alert Cancel OK', client_addr)
 
             try:
                 self._q.put({
-                            'raw': flask.request.data,
+                            'raw': raw,
                             'msg_type': cp.msg_type,
                             'identifier': cp.identifier,
                             'sender': cp.sender,
@@ -141,7 +165,7 @@ class CAPServer():
 
         # Generate an appropriate response
         xml = cp.generate_response(cp.identifier, cp.sender, cp.sent)
-        return flask.Response(response=xml, status=200, content_type='application/xml; charset=utf-8')
+        return flask.Response(response=xml, status=200, headers=self.RESPONSE_HEADERS)
 
     def __init__(self, srvcfg, q):
         self.app = flask.Flask(__name__)
@@ -154,6 +178,12 @@ class CAPServer():
         self._strict = srvcfg['cap'].getboolean('strict_parsing')
 
         self._cap = None
+        self._log_handler = None
+        self._log_listener = None
+
+        # Reject oversized requests before their body is buffered and parsed
+        self.app.config['MAX_CONTENT_LENGTH'] = self.MAX_CONTENT_LENGTH
+        self.app.register_error_handler(413, self._too_large)
 
         # setup the endpoint for '/'
         self.app.add_url_rule('/', 'index', self._index, methods=['POST'])
@@ -161,8 +191,9 @@ class CAPServer():
     def start(self):
         # Check if the version of PyExpat is vulnerable to XML DDoS attacks (version 2.4.1+).
         # See https://docs.python.org/3/library/xml.html#xml-vulnerabilitiesk
+        # This doesn't apply when lxml is used, as the CAP parser disables entity resolution for lxml.
         ver = pyexpat.version_info
-        if ver[0] < 2 or ver[1] < 4 or ver[2] < 1:
+        if lxml_etree is None and (ver[0] < 2 or ver[1] < 4 or ver[2] < 1):
             logger.warn('PyExpat 2.4.1+ is recommended but not found on this system, update your Python installation')
 
         # Remove Flask and werkzeug's default logging handler(s).
@@ -173,15 +204,21 @@ class CAPServer():
 
         # Setup log target
         strip_esc = StripEsc()
-        handler = logging.handlers.RotatingFileHandler(f'{self._logdir}/capsrv.log', mode='a', maxBytes=self._logsize, backupCount=5)
+        handler = logging.handlers.RotatingFileHandler(os.path.join(self._logdir, 'capsrv.log'), mode='a', maxBytes=self._logsize, backupCount=5)
         handler.setFormatter(logging.Formatter(fmt='%(asctime)s %(levelname)-8s %(message)s', datefmt='%y-%m-%d %H:%M'))
         handler.setLevel(logging.INFO)
         handler.addFilter(strip_esc)
 
+        # Request threads only queue their log records, a background thread filters and writes them to the log file
+        log_queue = queue.SimpleQueue()
+        self._log_handler = logging.handlers.QueueHandler(log_queue)
+        self._log_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        self._log_listener.start()
+
         # Setup the logging file for werkzeug and Flask
-        logging.getLogger('werkzeug').addHandler(handler)
+        logging.getLogger('werkzeug').addHandler(self._log_handler)
         logging.getLogger('werkzeug').setLevel(logging.INFO)
-        self.app.logger.addHandler(handler)
+        self.app.logger.addHandler(self._log_handler)
         self.app.logger.setLevel(logging.INFO)
 
         # Start the werkzeug/Flask thread
@@ -189,10 +226,10 @@ class CAPServer():
             self._cap = CAPHTTP(self.app, self._srvcfg)
             self._cap.start()
         except KeyError as e:
-            logger.error(f'Unable to start CAP HTTP server thread, check configuration. {e}')
+            logger.error('Unable to start CAP HTTP server thread, check configuration. %s', e)
             return False
         except Exception as e:
-            logger.error(f'Unable to start CAP HTTP server thread. {e}')
+            logger.error('Unable to start CAP HTTP server thread. %s', e)
             return False
 
         return True
@@ -201,6 +238,18 @@ class CAPServer():
         if self._cap is not None:
             self._cap.join()
 
+        # Flush the remaining log records and detach the log target, start() sets up a new one
+        if self._log_listener is not None:
+            logging.getLogger('werkzeug').removeHandler(self._log_handler)
+            self.app.logger.removeHandler(self._log_handler)
+
+            self._log_listener.stop()
+            for h in self._log_listener.handlers:
+                h.close()
+
+            self._log_handler = None
+            self._log_listener = None
+
     def restart(self):
         self.stop()
 
@@ -38,7 +38,7 @@ class DABAudioStream(threading.Thread):
         self.streamcfg = streamcfg
         self.output_path = output_path
 
-        self.streamdir = f'{srvcfg["general"]["logdir"]}/streams/{self.name}'
+        self.streamdir = os.path.join(srvcfg['general']['logdir'], 'streams', self.name)
         self.binpath = srvcfg['dab']['odrbin_path']
 
         self.audio = None
@@ -46,11 +46,11 @@ class DABAudioStream(threading.Thread):
 
         # Create a directory structure for the stream to save logs to and load DLS and MOT information from
         os.makedirs(self.streamdir, exist_ok=True)
-        os.makedirs(f'{self.streamdir}/logs', exist_ok=True)
+        os.makedirs(os.path.join(self.streamdir, 'logs'), exist_ok=True)
         if self.streamcfg.getboolean('dls_enable'):
-            open(f'{self.streamdir}/dls.txt', 'a').close()
+            open(os.path.join(self.streamdir, 'dls.txt'), 'a').close()
         if self.streamcfg.getboolean('mot_enable'):
-            os.makedirs(f'{self.streamdir}/mot', exist_ok=True)
+            os.makedirs(os.path.join(self.streamdir, 'mot'), exist_ok=True)
 
         self._running = True
 
@@ -61,15 +61,15 @@ class DABAudioStream(threading.Thread):
         pad_enable = self.streamcfg.getboolean('dls_enable') or self.streamcfg.getboolean('mot_enable')
 
         # Save our logs (FIXME rotate logs)
-        audiolog = open(f'{self.streamdir}/logs/audioenc.log', 'ab')
+        audiolog = open(os.path.join(self.streamdir, 'logs', 'audioenc.log'), 'ab')
         if pad_enable:
-            padlog = open(f'{self.streamdir}/logs/padenc.log', 'ab')
+            padlog = open(os.path.join(self.streamdir, 'logs', 'padenc.log'), 'ab')
 
         failcounter = 0
         while self._running and failcounter < 4:
             # Start up odr-audioenc DAB/DAB+ audio encoder
             audioenc_cmdline = [
-                                f'{self.binpath}/odr-audioenc',
+                                os.path.join(self.binpath, 'odr-audioenc'),
                                 f'--bitrate={self.streamcfg["bitrate"]}',
                                  '-D',
                                 f'--output=ipc://{self.output_path}',
@@ -98,16 +98,16 @@ class DABAudioStream(threading.Thread):
             # Start up odr-padenc PAD encoder
             if pad_enable:
                 padenc_cmdline = [
-                                f'{self.binpath}/odr-padenc',
+                                os.path.join(self.binpath, 'odr-padenc'),
                                  '--charset=0',
                                 f'--output={self.name}'
                                 ]
 
                 # Add DLS and MOT if enabled
                 if self.streamcfg.getboolean('dls_enable'):
-                    padenc_cmdline.append(f'--dls={self.streamdir}/dls.txt')
+                    padenc_cmdline.append(f'--dls={os.path.join(self.streamdir, "dls.txt")}')
                 if self.streamcfg.getboolean('mot_enable'):
-                    padenc_cmdline.append(f'--dir={self.streamdir}/mot')
+                    padenc_cmdline.append(f'--dir={os.path.join(self.streamdir, "mot")}')
                     padenc_cmdline.append(f'--sleep={self.streamcfg["mot_timeout"]}')
 
                 self.pad = subproc.Popen(padenc_cmdline, stdout=padlog, stderr=padlog)
@@ -199,11 +199,11 @@ class DABDataStream(multiprocessing.Process):
         self.group_builder = MSCDataGroupBuilder()
         self.packet_builder = PacketBuilder(1000) # FIXME don't hardcode the packet address, allow configuring in GUI
 
-        self.streamdir = f'{srvcfg["general"]["logdir"]}/streams/{self.name}'
+        self.streamdir = os.path.join(srvcfg['general']['logdir'], 'streams', self.name)
 
         # Create a directory structure for the stream to save logs to and load DLS and MOT information from
         os.makedirs(self.streamdir, exist_ok=True)
-        os.makedirs(f'{self.streamdir}/logs', exist_ok=True)
+        os.makedirs(os.path.join(self.streamdir, 'logs'), exist_ok=True)
 
         # TODO check if this is a fifo and create if needed/check for existence file
         path = streamcfg['input']
@@ -27,6 +27,24 @@ from dab.streams import DABStreams                               	# DAB streams
 
 logger = logging.getLogger('server.dab')
 
+def _content(tree:BoostInfoTree):
+    """
+    Return the values of a (sub)tree as nested (value, children) tuples, leaving out empty nodes.
+    BoostInfoTree creates empty nodes when a missing key is merely read, these don't count as a change.
+    """
+
+    children = []
+    for key, subtree in tree:
+        content = _content(subtree)
+        if content is not None:
+            children.append((key, content))
+
+    value = tree.value if tree.value else None
+    if value is None and not children:
+        return None
+
+    return (value, children)
+
 class ODRMuxConfig():
     """ ODR-DabMux config file wrapper class """
 
@@ -171,6 +189,14 @@ class ODRMuxConfig():
 
         self._oldcfg = copy.deepcopy(self.cfg)
 
+    def modified(self) -> bool:
+        """ Check if the config was changed since the temporary copy was made with save() """
+
+        if self._oldcfg is None:
+            return True
+
+        return _content(self.cfg) != _content(self._oldcfg)
+
     def restore(self):
         """ Restore the temporary copy made with save() """
 
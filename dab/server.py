@@ -26,7 +26,6 @@ import logging                          # Logging facilities
 import queue                            # Queue for passing data to the DAB processing thread
 import subprocess as subproc            # Support for starting subprocesses
 import threading                        # Threading support (for running odr-dabmux and odr-dabmod in the background)
-import time                             # For sleep support
 import zmq                              # For signalling (alarm) announcements to ODR-DabMux
 from dab.muxcfg import ODRMuxConfig     # odr-dabmux config
 from dab.streams import DABStreams      # DAB streams manager
@@ -51,28 +50,29 @@ class ODRServer(threading.Thread):
         self.mod = None
 
         # Check if ODR-DabMux and ODR-DabMod are available
-        muxbin = f'{self.binpath}/odr-dabmux'
-        if not os.path.isfile(muxbin):
-            raise Exception(f'Invalid path to DAB Multiplexer binary: {muxbin}')
+        self.muxbin = os.path.join(self.binpath, 'odr-dabmux')
+        if not os.path.isfile(self.muxbin):
+            raise Exception(f'Invalid path to DAB Multiplexer binary: {self.muxbin}')
 
-        modbin = f'{self.binpath}/odr-dabmod'
-        if not os.path.isfile(modbin):
-            raise Exception(f'Invalid path to DAB Modulator binary: {modbin}')
+        self.modbin = os.path.join(self.binpath, 'odr-dabmod')
+        if not os.path.isfile(self.modbin):
+            raise Exception(f'Invalid path to DAB Modulator binary: {self.modbin}')
 
         if os.name == 'posix':
-            if not os.access(muxbin, os.X_OK):
-                raise Exception(f'DAB Multiplexer binary not executable: {muxbin}')
-            if not os.access(modbin, os.X_OK):
-                raise Exception(f'DAB Modulator binary not executable: {modbin}')
+            if not os.access(self.muxbin, os.X_OK):
+                raise Exception(f'DAB Multiplexer binary not executable: {self.muxbin}')
+            if not os.access(self.modbin, os.X_OK):
+                raise Exception(f'DAB Modulator binary not executable: {self.modbin}')
 
         self._running = True
+        self._stopped = threading.Event()
 
     def run(self):
         """ Start the DAB server thread, which includes odr-dabmux and odr-dabmod """
 
         # TODO rotate this log, this is not so straightforward it appears
-        muxlog = open(f'{self.logdir}/dabmux.log', 'ab')
-        modlog = open(f'{self.logdir}/dabmod.log', 'ab')
+        muxlog = open(os.path.join(self.logdir, 'dabmux.log'), 'ab')
+        modlog = open(os.path.join(self.logdir, 'dabmod.log'), 'ab')
 
         # Create the FIFO that odr-dabmod outputs to
         utils.create_fifo(self.output)
@@ -81,11 +81,11 @@ class ODRServer(threading.Thread):
         while self._running and failcounter < 4:
             # Start up odr-dabmux DAB multiplexer
             muxlog.write('\n'.encode('utf-8'))
-            self.mux = subproc.Popen((f'{self.binpath}/odr-dabmux', self.muxcfg), stdout=subproc.PIPE, stderr=muxlog)
+            self.mux = subproc.Popen((self.muxbin, self.muxcfg), stdout=subproc.PIPE, stderr=muxlog)
 
             # Start up odr-dabmod DAB modulator
             modlog.write('\n'.encode('utf-8'))
-            self.mod = subproc.Popen((f'{self.binpath}/odr-dabmod', self.modcfg),
+            self.mod = subproc.Popen((self.modbin, self.modcfg),
                                     stdin=self.mux.stdout, stdout=subproc.PIPE, stderr=modlog)
 
             # Allow odr-dabmux to receive SIGPIPE if odr-dabmod exits
@@ -93,8 +93,8 @@ class ODRServer(threading.Thread):
             # Send odr-dabmux's data to odr-dabmod. This operation blocks until the process in killed
             self.mod.communicate()[0]
 
-            # Wait 4 seconds for sockets to unbind
-            time.sleep(4)
+            # Wait 4 seconds for sockets to unbind, unless the server is being stopped
+            self._stopped.wait(4)
 
             # Maintain a failcounter to automatically exit the loop if we are unable to bring the server up
             failcounter += 1
@@ -112,27 +112,35 @@ class ODRServer(threading.Thread):
             return
 
         self._running = False
+        self._stopped.set()
 
-        # Terminate the modulator and multiplexer
+        # Terminate the modulator and multiplexer, and wait for both of them to exit at the same time
+        procs = {}
         if self.mod is not None:
             self.mod.terminate()
-            try:
-                self.mod.wait(timeout=5)
-            except subproc.TimeoutExpired as e:
-                logger.error(f'Unable to terminate odr-dabmod. {e}')
-
+            procs[self.mod] = 'odr-dabmod'
         if self.mux is not None:
             self.mux.terminate()
-            try:
-                self.mux.wait(timeout=5)
-            except subproc.TimeoutExpired as e:
-                logger.error(f'Unable to terminate odr-dabmux. {e}')
+            procs[self.mux] = 'odr-dabmux'
+
+        for proc in utils.wait_processes(tuple(procs), 5):
+            logger.error(f'Unable to terminate {procs[proc]}, timed out after 5 seconds')
 
         # Remove the fifo file that was used as output
         os.remove(self.output)
 
         super().join()
 
+    def mux_alive(self) -> bool:
+        """ Check if the odr-dabmux process started by this thread is running """
+
+        return self.mux is not None and self.mux.poll() is None
+
+    def mod_alive(self) -> bool:
+        """ Check if the odr-dabmod process started by this thread is running """
+
+        return self.mod is not None and self.mod.poll() is None
+
 class DABServer():
     """ DABServer and CAPWatcher management class """
 
@@ -247,8 +255,7 @@ class DABServer():
 
         server = self._odr.is_alive() if self._odr is not None else None
         watcher = self._watcher.is_alive() if self._watcher is not None else None
-        # FIXME check these properly
-        mux = subproc.run(('pgrep', 'odr-dabmux'), capture_output=True).returncode == 0
-        mod = subproc.run(('pgrep', 'odr-dabmod'), capture_output=True).returncode == 0
+        mux = self._odr.mux_alive() if self._odr is not None else False
+        mod = self._odr.mod_alive() if self._odr is not None else False
 
         return (server, watcher, mux, mod)
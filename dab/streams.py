@@ -109,42 +109,77 @@ class DABStreams():
 
             return None
 
-    def setcfg(self, stream, newcfg=None):
-        """ Change the configuration for a stream, used for stream replacement mainly """
+    def _stop_thread(self, t):
+        """ Stop a stream thread or process """
 
-        i = 0
-        for s, t, c, o in self.streams:
-            # Get the current stream
-            if s == stream and c is not None:
-                # Don't continue if we're already running with the provided config
-                if newcfg == c:
-                    return
-
-                # Restore to the original stream
-                if newcfg is None:
-                    newcfg = self.config.cfg[stream]
-
-                # Stop the old stream
-                if t is not None:
-                    t.join()
-
-                    # Attempt terminating if joining wasn't successful (in case of a process)
-                    if t.is_alive() and isinstance(t, multiprocessing.Process):
-                        t.terminate()
-
-                        # A last resort
-                        if t.is_alive():
-                            t.kill()
-
-                    # Allow sockets some time to unbind (FIXME needed?)
-                    time.sleep(4)
-                self.streams.pop(i)
-
-                # And fire up the new one
+        t.join()
+
+        # Attempt terminating if joining wasn't successful (in case of a process)
+        if t.is_alive() and isinstance(t, multiprocessing.Process):
+            t.terminate()
+
+            # A last resort
+            if t.is_alive():
+                t.kill()
+
+    def setcfg_many(self, items):
+        """
+        Change the configuration for multiple streams, used for stream replacement mainly.
+        items is a list of (stream, newcfg) tuples, a newcfg of None restores the stream's original configuration.
+        All streams are stopped first, so they only have to wait once for their sockets to unbind.
+        """
+
+        restart = {}
+        stopped = False
+
+        for stream, newcfg in items:
+            if stream in restart:
+                continue
+
+            for i, (s, t, c, o) in enumerate(self.streams):
+                # Get the current stream
+                if s == stream and c is not None:
+                    break
+            else:
+                continue
+
+            # Don't continue if we're already running with the provided config
+            if newcfg == c:
+                continue
+
+            # Restore to the original stream
+            if newcfg is None:
+                newcfg = self.config.cfg[stream]
+
+            # Stop the old stream
+            if t is not None:
+                self._stop_thread(t)
+                stopped = True
+
+            restart[stream] = (i, o, newcfg)
+
+        # Allow sockets some time to unbind (FIXME needed?)
+        if stopped:
+            time.sleep(4)
+
+        # And fire up the new ones, still attempting the other streams if one of them fails to start
+        error = None
+        for stream, (i, o, newcfg) in restart.items():
+            self.streams.pop(i)
+
+            try:
                 self._start_stream(stream, i, o, newcfg)
-                return
+            except Exception as e:
+                if error is None:
+                    error = e
+
+        if error is not None:
+            raise error
+
+    def setcfg(self, stream, newcfg=None):
+        """ Change the configuration for a stream, used for stream replacement mainly """
 
-            i += 1
+        self.setcfg_many(((stream, newcfg),))
 
     def stop(self):
         if self.config is None:
@@ -152,15 +187,7 @@ class DABStreams():
 
         for _, t, _, o in self.streams:
             if t is not None:
-                t.join()
-
-                # Attempt terminating if joining wasn't successful (in case of a process)
-                if t.is_alive() and isinstance(t, multiprocessing.Process):
-                    t.terminate()
-
-                    # A last resort
-                    if t.is_alive():
-                        t.kill()
+                self._stop_thread(t)
 
             if o is not None:
                 utils.remove_fifo(o)
@@ -171,10 +198,13 @@ class DABStreams():
         if self.config is None:
             return False
 
-        # Allow sockets some time to unbind
-        time.sleep(4)
-
+        running = len(self.streams) > 0
         self.stop()
+
+        # Allow the sockets of the stopped streams some time to unbind
+        if running:
+            time.sleep(4)
+
         return self.start()
 
     def status(self):
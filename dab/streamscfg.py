@@ -57,6 +57,14 @@ class StreamsConfig():
 
         self._oldcfg = copy.deepcopy(self.cfg)
 
+    def modified(self) -> bool:
+        """ Check if the config was changed since the temporary copy was made with save() """
+
+        if self._oldcfg is None:
+            return True
+
+        return self.cfg != self._oldcfg
+
     def restore(self):
         """ Restore the temporary copy made with save() """
 
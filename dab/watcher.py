@@ -21,6 +21,7 @@
 
 import datetime                     # To get the current date and time
 import logging                      # Logging facilities
+import os                           # For building file paths
 import pyttsx3                      # Text To Speech engine frontend
 import queue                        # Queue for passing data to the DAB processing thread
 import subprocess as subproc        # For spawning ffmpeg to convert mp3 to wav
@@ -55,13 +56,13 @@ class CAPWatcher(threading.Thread):
         self.alarm = srvcfg['warning'].getboolean('alarm')
         self.replace = srvcfg['warning'].getboolean('replace')
         self.data = srvcfg['warning'].getboolean('data')
-        self.alarmpath = f'{srvcfg["general"]["logdir"]}/streams/sub-alarm'
+        self.alarmpath = os.path.join(srvcfg['general']['logdir'], 'streams', 'sub-alarm')
         self.announcement = srvcfg['warning']['announcement']
 
         # Create a fifo for data stream broadcasting
         # TODO create a temporary file in /tmp instead?
         #      this way of doing things is fine for debugging, but not for production
-        self.datafifo = f'{self.alarmpath}/data.fifo'
+        self.datafifo = os.path.join(self.alarmpath, 'data.fifo')
 
         self.tts = pyttsx3.init()
 
@@ -72,8 +73,8 @@ class CAPWatcher(threading.Thread):
     def _broadcast_tts(self, tts_str, language):
         # TODO create a temporary file in /tmp instead?
         #      this way of doing things is fine for debugging, but not for production
-        mp3 = f'{self.alarmpath}/tts.mp3'
-        wav = f'{self.alarmpath}/tts.wav'
+        mp3 = os.path.join(self.alarmpath, 'tts.mp3')
+        wav = os.path.join(self.alarmpath, 'tts.wav')
 
         # Look for a voice with the right language
         voice = next((v for v in self.tts.getProperty('voices') if v.languages[0] == language), None)
@@ -105,7 +106,7 @@ class CAPWatcher(threading.Thread):
 
         # Signal the alarm announcement if enabled in settings
         if self.alarm:
-            out = utils.mux_send(self.zmqsock, ('set', self.announcement, 'active', '1'))
+            out = utils.mux_send(self.zmqsock, (b'set', self.announcement.encode(), b'active', b'1'))
             logger.info(f'Activating alarm announcement, res: {out}')
 
         # Perform stream replacement if enabled in settings
@@ -117,6 +118,53 @@ class CAPWatcher(threading.Thread):
             else:
                 logger.info('Replaced audio streams with alarm stream successfully')
 
+    def _handle_message(self, a, announcements, future_announcements):
+        """ Handle a message received from the CAPServer, return True if the list of active announcements changed """
+
+        if a['msg_type'] == CAPParser.TYPE_ALERT:
+            # Skip this message if the expiry time is before the current time
+            if a['expires'] <= datetime.datetime.now(a['expires'].tzinfo):
+                logger.warn(f'Ignoring CAP message: {a["identifier"]}, expiration date has passed')
+
+                return False
+
+            # FIXME handle daylight savings properly
+            if a['effective'] <= datetime.datetime.now(a['effective'].tzinfo):
+                logger.info(f'New CAP message: {a["identifier"]}')
+                announcements.append(a)
+            else:
+                logger.info(f'New future CAP message: {a["identifier"]} for {a["effective"]}')
+                future_announcements.append(a)
+
+                return False
+        elif a['msg_type'] == CAPParser.TYPE_CANCEL:
+            cancelled = False
+
+            # Remove cancelled messages from the list
+            for ref in a['references']:
+                for _a in announcements:
+                    if ref['sender']     == _a['sender'] and \
+                       ref['identifier'] == _a['identifier'] and \
+                       ref['sent']       == _a['sent']:
+                        logger.info(f'Cancelled CAP message: {ref["identifier"]}')
+                        announcements.remove(_a)
+                        cancelled = True
+                for _a in future_announcements:
+                    if ref['sender']     == _a['sender'] and \
+                       ref['identifier'] == _a['identifier'] and \
+                       ref['sent']       == _a['sent']:
+                        logger.info(f'Cancelled CAP message: {ref["identifier"]}')
+                        future_announcements.remove(_a)
+                        cancelled = True
+
+            # Prevent restarting the stream(s) if no message was cancelled
+            if not cancelled:
+                logger.warn(f'Invalid CAP cancel request: {ref["identifier"]} {ref["sender"]} {ref["sent"]}')
+
+                return False
+
+        return True
+
     def run(self):
         # Maintain a list of currently active announcements
         announcements = []
@@ -181,56 +229,22 @@ class CAPWatcher(threading.Thread):
             try:
                 # Wait for a new CAP message from the CAPServer
                 a = self.q.get(block=True, timeout=1)
+            except queue.Empty:
+                if not changed:
+                    continue
+            else:
+                # Handle all messages that have queued up in one go, so a burst of messages only results in a single
+                # stream replacement and TTS broadcast
+                while True:
+                    if self._handle_message(a, announcements, future_announcements):
+                        changed = True
+                    self.q.task_done()
 
-                # Handle the current message
-                if a['msg_type'] == CAPParser.TYPE_ALERT:
-                    # Skip this message if the expiry time is before the current time
-                    if a['expires'] <= datetime.datetime.now(a['expires'].tzinfo):
-                        logger.warn(f'Ignoring CAP message: {a["identifier"]}, expiration date has passed')
-
-                        self.q.task_done()
-                        continue
+                    try:
+                        a = self.q.get_nowait()
+                    except queue.Empty:
+                        break
 
-                    # FIXME handle daylight savings properly
-                    if a['effective'] <= datetime.datetime.now(a['effective'].tzinfo):
-                        logger.info(f'New CAP message: {a["identifier"]}')
-                        announcements.append(a)
-                    else:
-                        logger.info(f'New future CAP message: {a["identifier"]} for {a["effective"]}')
-                        future_announcements.append(a)
-
-                        self.q.task_done()
-                        continue
-                elif a['msg_type'] == CAPParser.TYPE_CANCEL:
-                    cancelled = False
-
-                    # Remove cancelled messages from the list
-                    for ref in a['references']:
-                        for _a in announcements:
-                            if ref['sender']     == _a['sender'] and \
-                               ref['identifier'] == _a['identifier'] and \
-                               ref['sent']       == _a['sent']:
-                                logger.info(f'Cancelled CAP message: {ref["identifier"]}')
-                                announcements.remove(_a)
-                                cancelled = True
-                        for _a in future_announcements:
-                            if ref['sender']     == _a['sender'] and \
-                               ref['identifier'] == _a['identifier'] and \
-                               ref['sent']       == _a['sent']:
-                                logger.info(f'Cancelled CAP message: {ref["identifier"]}')
-                                future_announcements.remove(_a)
-                                cancelled = True
-
-                    # Prevent restarting the stream(s) if no message was cancelled
-                    if not cancelled:
-                        logger.warn(f'Invalid CAP cancel request: {ref["identifier"]} {ref["sender"]} {ref["sent"]}')
-
-                        self.q.task_done()
-                        continue
-
-                changed = True
-                self.q.task_done()
-            except queue.Empty:
                 if not changed:
                     continue
 
@@ -243,7 +257,7 @@ class CAPWatcher(threading.Thread):
                 for _, _, c, _ in self.streams.streams:
                     if c['output_type'] != 'data':
                         if self.alarm:
-                            out = utils.mux_send(self.zmqsock, ('set', 'alarm', 'active', '0'))
+                            out = utils.mux_send(self.zmqsock, (b'set', b'alarm', b'active', b'0'))
                             logger.info(f'Alarm announcement deactivated, res: {out}')
 
                         if self.replace:
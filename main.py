@@ -31,6 +31,8 @@ sys.path.append(os.path.dirname(SCRIPT_DIR))
 assert sys.version_info >= (3, 10)
 
 from configparser import ConfigParser   # Python INI file parser
+import configparser                     # For catching parse errors when reloading the config
+import functools                        # For caching the max path length
 import getpass                          # For getting the current user
 import logging                          # Logging facilities
 import logging.handlers                 # Logging handlers
@@ -38,66 +40,123 @@ import queue                            # Queue for passing data to the DAB proc
 import socket                           # To get the system's hostname
 import string                           # String utilities (for checking if string is hexadecimal)
 import time                             # For sleep support
-from dialog import Dialog               # Beautiful dialogs using the external program dialog
 from cap.server import CAPServer        # CAP server
 from dab.server import DABServer        # DAB server
 from dab.streams import DABStreams      # DAB streams
 import dab.types                        # DAB types
 import utils
 
-# Max path length from limits.h
-MAX_PATH = os.pathconf('/', 'PC_PATH_MAX')
+@functools.cache
+def _max_path():
+    """ Max path length from limits.h, only queried once it's actually needed """
+
+    try:
+        return os.pathconf('/', 'PC_PATH_MAX') or 4096
+    except (OSError, AttributeError):
+        return 4096
 
 # Config file path home
 try:
-    CONFIG_HOME = f'{os.environ["XDG_CONFIG_HOME"]}'
+    CONFIG_HOME = os.environ['XDG_CONFIG_HOME']
 except KeyError:
-    CONFIG_HOME = f'{os.path.expanduser("~")}/.config'
+    CONFIG_HOME = os.path.join(os.path.expanduser('~'), '.config')
 
 # Cache file home
 try:
-    CACHE_HOME = f'{os.environ["XDG_CACHE_HOME"]}'
+    CACHE_HOME = os.environ['XDG_CACHE_HOME']
 except KeyError:
-    CACHE_HOME = f'{os.path.expanduser("~")}/.cache'
+    CACHE_HOME = os.path.join(os.path.expanduser('~'), '.cache')
+
+# Config file paths
+CONFIG_DIR = os.path.join(CONFIG_HOME, 'cap-dab-server')
+SERVER_CONFIG = os.path.join(CONFIG_DIR, 'server.ini')
 
 # Setup the main server config file
-server_config = f'{CONFIG_HOME}/cap-dab-server/server.ini'
-os.makedirs(os.path.dirname(server_config), exist_ok=True)
+os.makedirs(CONFIG_DIR, exist_ok=True)
 srvcfg = ConfigParser()
-if os.path.isfile(server_config):
-    srvcfg.read(server_config)
-else:
-    srvcfg['general'] = {
-                         'logdir': f'{CACHE_HOME}/cap-dab-server',
-                         'max_log_size': '8192',
-                         'queuelimit': '10'
-                        }
-    srvcfg['dab'] =     {
-                         'stream_config': f'{CONFIG_HOME}/cap-dab-server/streams.ini',
-                         'odrbin_path': f'/usr/local/bin',
-                         'mux_config': f'{CONFIG_HOME}/cap-dab-server/dabmux.mux',
-                         'mod_config': f'{CONFIG_HOME}/cap-dab-server/dabmod.ini'
-                        }
-    srvcfg['cap'] =     {
-                         'host': '127.0.0.1',
-                         'port': '39800',
-                         'identifier': f'cap-dab-server.{socket.gethostname()}',
-                         'sender': f'{getpass.getuser()}@{socket.gethostname()}',
-                         'strict_parsing': 'no'
-                        }
-    srvcfg['warning'] = {
-                         'alarm': 'yes',
-                         'replace': 'yes',
-                         'data': 'no',
-                         'announcement': 'alarm',
-                         'label': 'Alert',
-                         'shortlabel': 'Alert',
-                         'pty': '3'
-                        }
-
-    with open(server_config, 'w') as config_file:
+srvcfg_mtime = None
+
+def get_config() -> ConfigParser:
+    """ Reload server.ini into memory, only if it has been modified since it was last read or written """
+
+    global srvcfg_mtime
+
+    try:
+        mtime = os.stat(SERVER_CONFIG).st_mtime_ns
+    except OSError:
+        return srvcfg
+
+    if mtime == srvcfg_mtime:
+        return srvcfg
+
+    # Also remember the modification time of a broken file, so it isn't parsed again on every call
+    srvcfg_mtime = mtime
+
+    # Parse into a separate parser first, so a broken file can't leave the config that is in use half updated
+    newcfg = ConfigParser()
+    try:
+        with open(SERVER_CONFIG, 'r') as config_file:
+            newcfg.read_file(config_file)
+    except (configparser.Error, OSError) as e:
+        logging.getLogger('server').error(f'Unable to reload {SERVER_CONFIG}, keeping the current configuration: {e}')
+        return srvcfg
+
+    # Copy the new config into the existing object, as the servers hold a reference to it
+    srvcfg.clear()
+    srvcfg.defaults().clear()
+    srvcfg.read_dict(newcfg)
+
+    return srvcfg
+
+def save_config():
+    """ Write the in-memory server config to server.ini """
+
+    global srvcfg_mtime
+
+    with open(SERVER_CONFIG, 'w') as config_file:
         srvcfg.write(config_file)
 
+    srvcfg_mtime = os.stat(SERVER_CONFIG).st_mtime_ns
+
+if os.path.isfile(SERVER_CONFIG):
+    # Don't fall back on an empty config at startup, a broken file should fail loudly here
+    with open(SERVER_CONFIG, 'r') as config_file:
+        srvcfg.read_file(config_file)
+    srvcfg_mtime = os.stat(SERVER_CONFIG).st_mtime_ns
+else:
+    # Load in the defaults in a single pass
+    srvcfg.read_dict({
+        'general': {
+                    'logdir': os.path.join(CACHE_HOME, 'cap-dab-server'),
+                    'max_log_size': '8192',
+                    'queuelimit': '10'
+                   },
+        'dab':     {
+                    'stream_config': os.path.join(CONFIG_DIR, 'streams.ini'),
+                    'odrbin_path': '/usr/local/bin',
+                    'mux_config': os.path.join(CONFIG_DIR, 'dabmux.mux'),
+                    'mod_config': os.path.join(CONFIG_DIR, 'dabmod.ini')
+                   },
+        'cap':     {
+                    'host': '127.0.0.1',
+                    'port': '39800',
+                    'identifier': f'cap-dab-server.{socket.gethostname()}',
+                    'sender': f'{getpass.getuser()}@{socket.gethostname()}',
+                    'strict_parsing': 'no'
+                   },
+        'warning': {
+                    'alarm': 'yes',
+                    'replace': 'yes',
+                    'data': 'no',
+                    'announcement': 'alarm',
+                    'label': 'Alert',
+                    'shortlabel': 'Alert',
+                    'pty': '3'
+                   }
+    })
+
+    save_config()
+
 # Create directories if they didn't exist yet
 os.makedirs(srvcfg['general']['logdir'], exist_ok=True)
 os.makedirs(srvcfg['dab']['odrbin_path'], exist_ok=True)
@@ -107,12 +166,75 @@ os.makedirs(os.path.dirname(srvcfg['dab']['mod_config']), exist_ok=True)
 # Setup a general server logger
 logger = logging.getLogger('server')
 logger.setLevel(logging.INFO)
-handler = logging.handlers.RotatingFileHandler(f'{srvcfg["general"]["logdir"]}/server.log', mode='a', maxBytes=int(srvcfg['general']['max_log_size'])*1024, backupCount=5)
+handler = logging.handlers.RotatingFileHandler(os.path.join(srvcfg['general']['logdir'], 'server.log'), mode='a', maxBytes=int(srvcfg['general']['max_log_size'])*1024, backupCount=5)
 handler.setFormatter(logging.Formatter(fmt='%(asctime)s %(name)-12s %(levelname)-8s %(message)s', datefmt='%y-%m-%d %H:%M:%s'))
 handler.setLevel(logging.INFO)
-logger.addHandler(handler)
 
-d = Dialog(dialog='dialog', autowidgetsize=True)
+# Log records are handed to a background thread that writes them to the log file, so logging never blocks on disk I/O
+log_queue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+log_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+log_listener.start()
+
+# Static menu entries, these never change so there's no need to rebuild them on every menu iteration
+MAIN_MENU_CHOICES = (
+    ('Status',      'View the server status'),
+    ('DAB',         'Configure the DAB multiplex'),
+    ('CAP',         'Configure the CAP server'),
+    ('Settings',    'Configure general server settings'),
+    ('Logs',        'View the server logs'),
+    ('Announce',    'Manually signal announcements'),
+    ('Restart',     'Restart one or more server components'),
+    ('Quit',        'Stop the server and quit')
+)
+
+DAB_MENU_CHOICES = (
+    ('Ensemble',          'Configure the ensemble'),
+    ('Streams',           'Add/Modify/Set the service streams/subchannels'),
+    ('Services',          'Add/Modify services'),
+    ('Warning settings',  'Configure various settings related to warning messages'),
+)
+
+ENSEMBLE_MENU_CHOICES = (
+    ('Country',           'Change the DAB Country ID and ECC'),
+    ('Label',             'Change the ensemble label'),
+    ('Announcements',     'Add/Remove/Modify ensemble announcements (FIG 0/19)')
+)
+
+STREAM_MENU_CHOICES = (
+    ('Stream Input',    'Configure the stream input'),
+    ('Bitrate',         'Configure the bitrate to broadcast this stream at'),
+    ('Protection',      'Configure the DAB protection level for the subchannel'),
+    ('PAD Components',  'Configure PAD components for this subchannel')
+    #('DLS',               ''),
+    #('Slideshow',         ''),
+    #('Slideshow Timeout', ''),
+    #('Pad length',        '')
+)
+
+SERVICE_MENU_CHOICES = (
+    ('ID',              'Change the service ID'),
+    ('Country',         'Override the Country from the ensemble default (Optional)'),
+    ('Label',           'Change the service label'),
+    ('Programme Type',  'Change the programme type (Optional)'),
+    ('Announcements',   'Select which announcement to support on this service (Optional)'),
+    ('Clusters',        'Change which announcement cluster this service belong to (Optional)'),
+    ('Stream',          'Configure which stream this service should broadcast')
+)
+
+WARNING_MENU_CHOICES = (
+    ('CAP announcement',  'Select which Alarm announcement to use for CAP Alerts'),
+    ('Label',             'Configure DAB label to show during warning messages'),
+    ('Programme Type',    'Configure PTY to show during warning messages'),
+    ('Warning method',    'Set the method by which warning messages are sent')
+)
+
+LOG_MENU_CHOICES = (
+    ('Server',        'View main server log'),
+    ('CAP',           'View CAP HTTP server log'),
+    ('Multiplexer',   'View DAB Multiplexer log'),
+    ('Modulator',     'View DAB Modulator log')
+)
 
 def _error(msg=''):
     d.msgbox(f'''
@@ -187,9 +309,7 @@ def status():
             states.insert(3, [f'  - {s[0]}', state(s[1])])
 
         # Format the states list into columns
-        sstr = ''
-        for s in states:
-            sstr += '{: <20}{: <6}\n'.format(*s)
+        sstr = ''.join(f'{name: <20}{st: <6}\n' for name, st in states)
 
         code = d.msgbox(sstr, colors=True, title='Server Status', no_collapse=True,
                         ok_label='Refresh', extra_button=True, extra_label='Exit')
@@ -278,11 +398,7 @@ def dab_config():
             #        ])
 
         while True:
-            code, tag = d.menu('', title=localtitle, cancel_label='Back', choices=[
-                              ('Country',           'Change the DAB Country ID and ECC'),
-                              ('Label',             'Change the ensemble label'),
-                              ('Announcements',     'Add/Remove/Modify ensemble announcements (FIG 0/19)')
-                              ])
+            code, tag = d.menu('', title=localtitle, cancel_label='Back', choices=ENSEMBLE_MENU_CHOICES)
 
             if code in (Dialog.CANCEL, Dialog.ESC):
                 break
@@ -406,16 +522,8 @@ def dab_config():
                 _error('Not Yet Implemented. Default is: DLS enabled, MOT slideshow disabled. Configure in streams.ini')
 
             while True:
-                code, tag = d.menu('', title=localtitle, extra_button=True, extra_label='Delete', cancel_label='Back', choices=[
-                                  ('Stream Input',    'Configure the stream input'),
-                                  ('Bitrate',         'Configure the bitrate to broadcast this stream at'),
-                                  ('Protection',      'Configure the DAB protection level for the subchannel'),
-                                  ('PAD Components',  'Configure PAD components for this subchannel')
-                                  #('DLS',               ''),
-                                  #('Slideshow',         ''),
-                                  #('Slideshow Timeout', ''),
-                                  #('Pad length',        '')
-                                  ])
+                code, tag = d.menu('', title=localtitle, extra_button=True, extra_label='Delete', cancel_label='Back',
+                                   choices=STREAM_MENU_CHOICES)
 
                 if code in (Dialog.CANCEL, Dialog.ESC):
                     break
@@ -573,15 +681,8 @@ The \ZbService ID\Zn is a 3 character, unique, hexadecimal identifier for a serv
                         break
 
             while True:
-                code, tag = d.menu('', title=localtitle, extra_button=True, extra_label='Delete', cancel_label='Back', choices=[
-                                  ('ID',              'Change the service ID'),
-                                  ('Country',         'Override the Country from the ensemble default (Optional)'),
-                                  ('Label',           'Change the service label'),
-                                  ('Programme Type',  'Change the programme type (Optional)'),
-                                  ('Announcements',   'Select which announcement to support on this service (Optional)'),
-                                  ('Clusters',        'Change which announcement cluster this service belong to (Optional)'),
-                                  ('Stream',          'Configure which stream this service should broadcast')
-                                  ])
+                code, tag = d.menu('', title=localtitle, extra_button=True, extra_label='Delete', cancel_label='Back',
+                                   choices=SERVICE_MENU_CHOICES)
 
                 if code in (Dialog.CANCEL, Dialog.ESC):
                     break
@@ -687,8 +788,7 @@ The \ZbService ID\Zn is a 3 character, unique, hexadecimal identifier for a serv
                 srvcfg['warning']['announcement'] = tag
 
                 # FIXME save in the previous menu not here
-                with open(server_config, 'w') as config_file:
-                    srvcfg.write(config_file)
+                save_config()
 
         def method():
             code, tags = d.checklist('Select the method by which you want the server to send DAB warning messages',
@@ -705,12 +805,7 @@ The \ZbService ID\Zn is a 3 character, unique, hexadecimal identifier for a serv
                 srvcfg['warning']['Data'] = 'yes' if 'Data' in tags else 'no'
 
         while True:
-            code, tag = d.menu('', title=localtitle, cancel_label='Back', choices=[
-                              ('CAP announcement',  'Select which Alarm announcement to use for CAP Alerts'),
-                              ('Label',             'Configure DAB label to show during warning messages'),
-                              ('Programme Type',    'Configure PTY to show during warning messages'),
-                              ('Warning method',    'Set the method by which warning messages are sent')
-                              ])
+            code, tag = d.menu('', title=localtitle, cancel_label='Back', choices=WARNING_MENU_CHOICES)
 
             if code in (Dialog.CANCEL, Dialog.ESC):
                 break
@@ -730,8 +825,7 @@ The \ZbService ID\Zn is a 3 character, unique, hexadecimal identifier for a serv
                         srvcfg['warning']['shortlabel'] = label[:8]
 
                 # FIXME save in the previous menu not here
-                with open(server_config, 'w') as config_file:
-                    srvcfg.write(config_file)
+                save_config()
             elif tag == 'Programme Type':
                 pty = _pty_config(f'PTY - {localtitle}', int(srvcfg['warning']['pty']))
 
@@ -739,25 +833,26 @@ The \ZbService ID\Zn is a 3 character, unique, hexadecimal identifier for a serv
                     srvcfg['warning']['pty'] = str(pty)
 
                 # FIXME save in the previous menu not here
-                with open(server_config, 'w') as config_file:
-                    srvcfg.write(config_file)
+                save_config()
             elif tag == 'Warning method':
                 method()
 
-    # Before doing anything, create a copy of the current config files
+    # Before doing anything, pick up any external changes made to server.ini and create a copy of the current config files
+    get_config()
     dabstreams.config.save()
     dabsrv.config.save()
     # TODO also create a copy of server.ini
+    warning = dict(srvcfg['warning'])
 
     while True:
-        code, tag = d.menu('', title=TITLE, extra_button=True, extra_label='Save', choices=[
-                          ('Ensemble',          'Configure the ensemble'),
-                          ('Streams',           'Add/Modify/Set the service streams/subchannels'),
-                          ('Services',          'Add/Modify services'),
-                          ('Warning settings',  'Configure various settings related to warning messages'),
-                          ])
+        code, tag = d.menu('', title=TITLE, extra_button=True, extra_label='Save', choices=DAB_MENU_CHOICES)
 
         if code == Dialog.EXTRA:
+            # Don't bother writing the config and restarting the DAB server if nothing was changed
+            if not dabstreams.config.modified() and not dabsrv.config.modified() and \
+               dict(srvcfg['warning']) == warning:
+                break
+
             # Write config and restart the DAB server
             # FIXME saving while announcement is playing keeps stream, but doesn't keep alarm announcement
             d.gauge_start('', height=6, width=64, percent=0)
@@ -781,13 +876,18 @@ The \ZbService ID\Zn is a 3 character, unique, hexadecimal identifier for a serv
             warning_config()
 
 def settings():
+    max_path = _max_path()
+
+    # Pick up any external changes made to server.ini
+    get_config()
+
     while True:
         code, elems = d.mixedform('', title='General Server Configuration', colors=True, ok_label='Save',
                                   item_help=True, help_tags=True, elements=[
-            ('Server config',       1,  1, server_config,                     1,  20, 64, MAX_PATH, 2,
+            ('Server config',       1,  1, SERVER_CONFIG,                     1,  20, 64, max_path, 2,
              'server.ini config file path'),
 
-            ('Log directory',       2,  1, srvcfg['general']['logdir'],       2,  20, 64, MAX_PATH, 0,
+            ('Log directory',       2,  1, srvcfg['general']['logdir'],       2,  20, 64, max_path, 0,
              'Directory to write log files to'),
 
             ('Max log size',        3,  1, srvcfg['general']['max_log_size'], 3,  20, 8,  7,        0,
@@ -796,16 +896,16 @@ def settings():
             ('CAP-DAB queue limit', 4,  1, srvcfg['general']['queuelimit'],   4,  20, 8,  7,        0,
              'Maximum number of CAP messages that can be in the queue at one moment (requires manual restart)'),
 
-            ('Streams config',      5,  1, srvcfg['dab']['stream_config'],    5,  20, 64, MAX_PATH, 0,
+            ('Streams config',      5,  1, srvcfg['dab']['stream_config'],    5,  20, 64, max_path, 0,
              'streams.ini config file path'),
 
-            ('ODR binaries path',   6,  1, srvcfg['dab']['odrbin_path'],      6,  20, 64, MAX_PATH, 0,
+            ('ODR binaries path',   6,  1, srvcfg['dab']['odrbin_path'],      6,  20, 64, max_path, 0,
              'Directory containing ODR-DabMux, ODR-DabMod, ODR-PadEnc and ODR-AudioEnc'),
 
-            ('ODR-DabMux config',   7,  1, srvcfg['dab']['mux_config'],       7,  20, 64, MAX_PATH, 0,
+            ('ODR-DabMux config',   7,  1, srvcfg['dab']['mux_config'],       7,  20, 64, max_path, 0,
              'dabmux.mux config file path'),
 
-            ('ODR-DabMod config',   8,  1, srvcfg['dab']['mod_config'],       8,  20, 64, MAX_PATH, 0,
+            ('ODR-DabMod config',   8,  1, srvcfg['dab']['mod_config'],       8,  20, 64, max_path, 0,
              'dabmod.ini config file path')
             ])
 
@@ -822,8 +922,7 @@ def settings():
                                  'mux_config':   elems[6],
                                  'mod_config':   elems[7]
                                 }
-            with open(server_config, 'w') as config_file:
-                srvcfg.write(config_file)
+            save_config()
 
             # Restart the CAP and DAB server to apply changes
             d.gauge_start('', height=6, width=64, percent=0)
@@ -840,7 +939,8 @@ def logbox(file):
         if code in (Dialog.EXTRA, Dialog.ESC):
             break
         elif code in (Dialog.CANCEL, Dialog.HELP):
-            open(file, 'w').close()
+            # All writers open their logs with O_APPEND, so they continue at the new end of file
+            os.truncate(file, 0)
             break
 
 def log():
@@ -850,28 +950,28 @@ def log():
 
         logbox(path)
 
-    while True:
-        code, tag = d.menu('', title='Server log management', ok_label='Select', cancel_label='Back', choices=[
-                          ('Server',        'View main server log'),
-                          ('CAP',           'View CAP HTTP server log'),
-                          ('Multiplexer',   'View DAB Multiplexer log'),
-                          ('Modulator',     'View DAB Modulator log')
-                          ])
+    # Resolve the log file paths once, the log directory can't change while in this menu
+    logdir = get_config()['general']['logdir']
+    log_paths = {
+        'Server':       os.path.join(logdir, 'server.log'),
+        'CAP':          os.path.join(logdir, 'capsrv.log'),
+        'Multiplexer':  os.path.join(logdir, 'dabmux.log'),
+        'Modulator':    os.path.join(logdir, 'dabmod.log')
+    }
 
-        logdir = srvcfg['general']['logdir']
+    while True:
+        code, tag = d.menu('', title='Server log management', ok_label='Select', cancel_label='Back',
+                           choices=LOG_MENU_CHOICES)
 
         if code in (Dialog.CANCEL, Dialog.ESC):
             break
-        elif tag == 'Server':
-            viewlog(f'{logdir}/server.log')
-        elif tag == 'CAP':
-            viewlog(f'{logdir}/capsrv.log')
-        elif tag == 'Multiplexer':
-            viewlog(f'{logdir}/dabmux.log')
-        elif tag == 'Modulator':
-            viewlog(f'{logdir}/dabmod.log')
+        elif tag in log_paths:
+            viewlog(log_paths[tag])
 
 def cap_config():
+    # Pick up any external changes made to server.ini
+    get_config()
+
     while True:
         code, elems = d.mixedform('', title='CAP Configuration', colors=True, ok_label='Save',
                                   item_help=True, help_tags=True, elements=[
@@ -905,8 +1005,7 @@ def cap_config():
                              'sender':           elems[3],
                              'strict_parsing':   elems[4]
                             }
-            with open(server_config, 'w') as config_file:
-                srvcfg.write(config_file)
+            save_config()
 
             # Restart the CAP server to apply changes
             d.gauge_start('', height=6, width=64, percent=0)
@@ -937,7 +1036,7 @@ def announce():
             subch = str(announcement.subchannel)
 
             # query the state of the announcement
-            state = bool(int(utils.mux_send(dabsrv.zmqsock, ('get', name, 'active'))))
+            state = bool(int(utils.mux_send(dabsrv.zmqsock, (b'get', name.encode(), b'active'))))
 
             menu.append((f'{"* " if state else "  "}{name}', f'Cluster {cluster}: {supported} (Switch to "{subch}")'))
 
@@ -957,10 +1056,10 @@ Announcements prefixed with a * are currently active.
             # Check if the announcement is active or not
             out = ''
             if tag[0] == '*':
-                out = utils.mux_send(dabsrv.zmqsock, ('set', announcement, 'active', '0'))
+                out = utils.mux_send(dabsrv.zmqsock, (b'set', announcement.encode(), b'active', b'0'))
                 logger.info(f'Manually deactivating {announcement} announcement, res: {out}')
             else:
-                out = utils.mux_send(dabsrv.zmqsock, ('set', announcement, 'active', '1'))
+                out = utils.mux_send(dabsrv.zmqsock, (b'set', announcement.encode(), b'active', b'1'))
                 logger.info(f'Manually activating {announcement} announcement, res: {out}')
 
             # Check if the announcement was successfully activated
@@ -973,16 +1072,8 @@ def restart():
 
 def main_menu():
     while True:
-        code, tag = d.menu('Main menu', title='CAP-DAB Server', ok_label='Select', no_cancel=True, choices=[
-                          ('Status',      'View the server status'),
-                          ('DAB',         'Configure the DAB multiplex'),
-                          ('CAP',         'Configure the CAP server'),
-                          ('Settings',    'Configure general server settings'),
-                          ('Logs',        'View the server logs'),
-                          ('Announce',    'Manually signal announcements'),
-                          ('Restart',     'Restart one or more server components'),
-                          ('Quit',        'Stop the server and quit')
-                          ])
+        code, tag = d.menu('Main menu', title='CAP-DAB Server', ok_label='Select', no_cancel=True,
+                           choices=MAIN_MENU_CHOICES)
 
         if code == Dialog.ESC or tag == 'Quit':
             break
@@ -1003,7 +1094,11 @@ def main_menu():
 
 # Main setup
 def main():
-    global capsrv, dabsrv, dabstreams
+    global capsrv, dabsrv, dabstreams, d, Dialog
+
+    # Load dialog only once the TUI is actually started
+    from dialog import Dialog           # Beautiful dialogs using the external program dialog
+    d = Dialog(dialog='dialog', autowidgetsize=True)
 
     d.set_background_title('CFNS - Rijkswaterstaat CIV, Delft © 2021 - 2022 | Bastiaan Teeuwen <bastiaan@mkcl.nl>')
 
@@ -1064,5 +1159,8 @@ def main():
     time.sleep(0.5)
     d.gauge_stop()
 
+    # Flush any remaining log records to the log file
+    log_listener.stop()
+
 if __name__ == '__main__':
     main()
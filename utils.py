@@ -19,30 +19,47 @@
 #    along with cap-dab-server. If not, see <https://www.gnu.org/licenses/>.
 #
 
-from configparser import ConfigParser           # For parsing the server config
-import copy                                     # For creating a copy on the stream configuration
+import atexit                                   # For removing the temporary FIFO directory on exit
+from configparser import ConfigParser, SectionProxy # For parsing the server config
+import functools                                # For creating the temporary FIFO directory only once
 import logging                                  # Logging facilities
 import os                                       # For file I/O
+import select                                   # For waiting on processes to exit
+import shutil                                   # For removing the temporary FIFO directory
 import stat                                     # For checking if output is a FIFO
+import subprocess as subproc                    # For waiting on subprocesses
 import tempfile                                 # For creating a temporary FIFO
+import time                                     # For tracking the remaining wait time
+from typing import TYPE_CHECKING                # For importing modules only used in type annotations
 import uuid                                     # For generating random FIFO file names
-import zmq                                      # For signalling (alarm) announcements to ODR-DabMux
-from dab.boost_info_parser import BoostInfoTree # For parsing the multiplexer config
-from dab.streams import DABStreams              # DAB streams
 
-def logger_strict(logger:logging.Logger, strict:bool, msg:str) -> bool:
+# Only needed for type annotations, importing dab.streams at runtime would pull in all of the DAB stream modules
+if TYPE_CHECKING:
+    from dab.boost_info_parser import BoostInfoTree # For parsing the multiplexer config
+    from dab.streams import DABStreams              # DAB streams
+
+# Component types of the streams that are replaced: audio components (DAB, DAB+) and packet data components
+_AUDIO_TYPES = frozenset((0, 1, 2))
+_PACKET_TYPES = frozenset((59,))
+
+def logger_strict(logger:logging.Logger, strict:bool, msg:str, *args) -> bool:
     """
     Log via logging.error or logging.warning depending on whether strict CAP parsing is enforced or not.
+    msg is only formatted with args if the message is actually logged.
 
     Return True if strict parsing is enabled or False if strict parsing is disabled
     """
 
-    if strict:
-        logger.error(msg)
-        return True
-    else:
-        logger.warning(msg)
-        return False
+    logger.log(logging.ERROR if strict else logging.WARNING, msg, *args)
+    return strict
+
+@functools.cache
+def _fifo_dir() -> str:
+    """ Create the temporary directory that holds all temporary FIFOs, it is removed when the server exits """
+
+    path = tempfile.mkdtemp(prefix='cap-dab-server-')
+    atexit.register(shutil.rmtree, path, ignore_errors=True)
+    return path
 
 def create_fifo(path:str=None) -> str:
     """
@@ -55,26 +72,33 @@ def create_fifo(path:str=None) -> str:
 
     if path is None:
         # Create a new temporary file if no path was specified
-        path = os.path.join(tempfile.mkdtemp(), str(uuid.uuid4()))
+        path = os.path.join(_fifo_dir(), str(uuid.uuid4()))
         os.mkfifo(path)
     else:
         # Check if there's already a file with the same name as our output
-        if os.path.exists(path):
-            # If this is a FIFO, we don't need to take any action
-            if not stat.S_ISFIFO(os.stat(path).st_mode):
-                # Otherwise delete the file/dir
-                if os.path.isfile(path):
-                    os.remove(path)
-                elif os.path.isdir(path):
-                    os.rmdir(path)
-                else:
-                    raise Exception(f'Unable to remove already existing FIFO path: {path}')
-
-                # Create the FIFO
-                os.mkfifo(path)
-        else:
+        try:
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
             # Create the FIFO that odr-dabmod outputs to
             os.mkfifo(path)
+            return path
+
+        # If this is a FIFO, we don't need to take any action
+        if stat.S_ISREG(mode):
+            # Otherwise replace the file with a new FIFO in one go, so the path never goes missing in between
+            tmp = f'{path}.{uuid.uuid4().hex}'
+            os.mkfifo(tmp)
+            try:
+                os.replace(tmp, path)
+            except OSError:
+                os.remove(tmp)
+                raise
+        elif stat.S_ISDIR(mode):
+            # A directory can't be replaced by a FIFO, so delete it first
+            os.rmdir(path)
+            os.mkfifo(path)
+        elif not stat.S_ISFIFO(mode):
+            raise Exception(f'Unable to remove already existing FIFO path: {path}')
 
     return path
 
@@ -87,15 +111,63 @@ def remove_fifo(path:str):
 
     try:
         os.remove(path)
-        os.rmdir(os.path.dirname(path))
     except OSError:
         pass
 
-def mux_send(sock, msgs:tuple) -> str | None:
+def wait_processes(procs:tuple, timeout:float) -> list:
     """
-    Send a message over ZeroMQ to ODR-DabMux and wait for a reply.
+    Wait for several subprocesses to exit at the same time. Where supported, a pidfd is used for each process to sleep
+    until they exit instead of periodically polling their state.
 
-    Return the received message
+    Return a list of the processes that did not exit within timeout seconds
+    """
+
+    deadline = time.monotonic() + timeout
+    pending = {}
+
+    try:
+        try:
+            for proc in procs:
+                if proc.returncode is None:
+                    pending[os.pidfd_open(proc.pid)] = proc
+        except (AttributeError, OSError):
+            # pidfd is not supported on this platform (Linux 5.3+ only), fall back to polling
+            for proc in procs:
+                try:
+                    proc.wait(timeout=max(deadline - time.monotonic(), 0))
+                except subproc.TimeoutExpired:
+                    pass
+
+            return [proc for proc in procs if proc.returncode is None]
+
+        poller = select.poll()
+        for fd in pending:
+            poller.register(fd, select.POLLIN)
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            for fd, _ in poller.poll(int(remaining * 1000)):
+                poller.unregister(fd)
+                os.close(fd)
+
+                # Reap the process
+                pending.pop(fd).wait()
+    finally:
+        for fd in pending:
+            os.close(fd)
+
+    return list(pending.values())
+
+def mux_send_many(sock, cmds:list) -> list | None:
+    """
+    Send a batch of messages over ZeroMQ to ODR-DabMux, checking the connection with a single ping beforehand.
+    Every message is a tuple of bytes, one for each part of the message.
+    The REQ socket requires every message to be answered before the next one can be sent.
+
+    Return a list of the received messages
     """
 
     # TODO handle failed scenario
@@ -103,28 +175,42 @@ def mux_send(sock, msgs:tuple) -> str | None:
     # Perform a quick ping test
     sock.send(b'ping')
     data = sock.recv_multipart()
-    if data[0].decode() != 'ok':
+    if data[0] != b'ok':
         return None
 
-    # Send our actual command
-    for i, part in enumerate(msgs):
-        if i == len(msgs) - 1:
-            f = 0
-        else:
-            f = zmq.SNDMORE
+    results = []
+    for msgs in cmds:
+        # Send our actual command
+        sock.send_multipart(msgs)
 
-        sock.send(part.encode(), flags=f)
+        # Wait for the results
+        data = sock.recv_multipart()
+        results.append(b''.join(data).decode('utf-8'))
 
-    # Wait for the results
-    data = sock.recv_multipart()
-    res = ''
+    return results
 
-    for i, part in enumerate(data):
-        res += part.decode()
+def mux_send(sock, msgs:tuple) -> str | None:
+    """
+    Send a message (a tuple of bytes) over ZeroMQ to ODR-DabMux and wait for a reply.
+
+    Return the received message
+    """
+
+    results = mux_send_many(sock, (msgs,))
+    return results[0] if results is not None else None
+
+def _copy_section(section:SectionProxy, override:dict) -> SectionProxy:
+    """
+    Copy a single config section into a new parser, with the values in override replacing those of the section.
+    Unlike a deepcopy of the section, this doesn't copy the parser the section belongs to along with it.
+    The values are already interpolated, so interpolation is disabled for the copy.
+    """
 
-    return res
+    parser = ConfigParser(interpolation=None)
+    parser.read_dict({section.name: {**section, **override}})
+    return parser[section.name]
 
-def replace_streams(zmqsock, srvcfg:ConfigParser, muxcfg:BoostInfoTree, streams:DABStreams, input_type:str=None, inputuri:str=None, data_streams:bool=False):
+def replace_streams(zmqsock, srvcfg:ConfigParser, muxcfg:'BoostInfoTree', streams:'DABStreams', input_type:str=None, inputuri:str=None, data_streams:bool=False):
     """
     Replace all streams which support Alarm announcements with the specified input and input_type.
 
@@ -135,6 +221,39 @@ def replace_streams(zmqsock, srvcfg:ConfigParser, muxcfg:BoostInfoTree, streams:
 
     alarm_on = input_type is not None or inputuri is not None
 
+    if alarm_on:
+        # Look up the label and PTY configured for Alarm announcements once, they're the same for every service
+        # FIXME create a setting for this, don't hardcode!!!
+        warning = srvcfg['warning']
+        alarm_label = warning['label']
+        alarm_shortlabel = warning['shortlabel']
+        alarm_pty = warning['pty']
+
+        # Stream config values that are replaced for every stream
+        # TODO change DLS
+        override = {
+            'input_type': input_type,
+            'input': inputuri,
+            'dls_enable': 'no',
+            'mot_enable': 'no'
+        }
+
+    # Look up stream configurations by name, stream names are unique as they are the section names in streams.ini
+    stream_index = {s: c for s, _, c, _ in streams.streams}
+
+    # Group the components by the service they belong to, so the components don't have to be walked for every service
+    by_service = {}
+    for _, component in muxcfg.components:
+        by_service.setdefault(str(component.service), []).append(component)
+
+    # Only replace audio streams, or only packet data streams
+    replace_types = _PACKET_TYPES if data_streams else _AUDIO_TYPES
+
+    # Label and PTY changes are collected and sent to the multiplexer in a single batch,
+    # before the streams of the services are replaced
+    cmds = []
+    subchannels = []
+
     for sname, service in muxcfg.services:
         # Check if this service supports alarm announcements
         # TODO also support Warning announcement
@@ -144,10 +263,9 @@ def replace_streams(zmqsock, srvcfg:ConfigParser, muxcfg:BoostInfoTree, streams:
 
         if alarm_on:
             # Replace the service Label and PTY to the one configured for Alarm announcements
-            # FIXME create a setting for this, don't hardcode!!!
-            label = srvcfg['warning']['label']
-            shortlabel = srvcfg['warning']['shortlabel']
-            pty = srvcfg['warning']['pty']
+            label = alarm_label
+            shortlabel = alarm_shortlabel
+            pty = alarm_pty
         else:
             # Restore the original service labels
             # FIXME generate shortlabel if there's no shortlabel
@@ -155,50 +273,38 @@ def replace_streams(zmqsock, srvcfg:ConfigParser, muxcfg:BoostInfoTree, streams:
             shortlabel = str(service['shortlabel'])
             pty = str(service['pty'])
 
-        mux_send(zmqsock, ('set', sname, 'label', f'{label},{shortlabel}'))
+        sname_b = sname.encode()
+        cmds.append((b'set', sname_b, b'label', f'{label},{shortlabel}'.encode()))
         if pty != '':
-            mux_send(zmqsock, ('set', sname, 'pty', pty))
+            cmds.append((b'set', sname_b, b'pty', pty.encode()))
 
         # Get the streams corresponding to this service
-        for _, component in muxcfg.components:
-            if str(component.service) != sname:
+        for component in by_service.get(sname, ()):
+            if int(str(component.type)) not in replace_types:
                 continue
 
-            component_type = int(str(component.type))
-            if not data_streams:
-                # Skip non-audio components
-                if component_type not in (0, 1, 2):
-                    continue
-            else:
-                # Only packet data comonents
-                if component_type != 59:
-                    continue
-
-            # Check if this name exists in the config too
             subchannel = str(component.subchannel)
-            found = False
 
-            # TODO can this be done prettier?
-            for s, _, c, _ in streams.streams:
-                if s == subchannel:
-                    found = True
+            # Check if this name exists in the config too
+            if subchannel not in stream_index:
+                raise Exception(f'Misconfiguration: stream "{subchannel}" was not found in streams.ini!')
 
-                    # TODO change DLS
-                    if alarm_on:
-                        # Create a copy of the stream's config
-                        cfg = copy.deepcopy(c)
+            subchannels.append(subchannel)
 
-                        cfg['input_type'] = input_type
-                        cfg['input'] = inputuri
+    if cmds:
+        mux_send_many(zmqsock, cmds)
 
-                        cfg['dls_enable'] = 'no'
-                        cfg['mot_enable'] = 'no'
+    updates = []
+    for subchannel in subchannels:
+        if alarm_on:
+            # Create a copy of the stream's config with the replacement input
+            cfg = _copy_section(stream_index[subchannel], override)
 
-                        # Perform stream replacement on the corresponding subchannel/stream
-                        streams.setcfg(s, cfg)
-                    else:
-                        # Restore the old stream
-                        streams.setcfg(s)
+            # Perform stream replacement on the corresponding subchannel/stream
+            updates.append((subchannel, cfg))
+        else:
+            # Restore the old stream
+            updates.append((subchannel, None))
 
-            if not found:
-                raise Exception(f'Misconfiguration: stream "{subchannel}" was not found in streams.ini!')
+    # Replace all streams at once, so they're all stopped and restarted together
+    streams.setcfg_many(updates)